@@ -37,11 +37,64 @@ export class DKBService {
       console.log(`[DKB] Command: python3 ${args.join(' ').replace(password, '***')}`);
 
       const pythonProcess = spawn('python3', args);
-      let stdout = '';
       let stderr = '';
 
+      // The script streams NDJSON: a header with the accounts and transaction
+      // field names, one array per transaction and an end record, or a single
+      // {success: false} record on error
+      let pending = '';
+      let header = null;
+      let failure = null;
+      let finished = false;
+      let parseError = null;
+      const transactions = [];
+
+      // Runs inside the stdout listener, so it must never throw: a bad line
+      // is recorded and the promise is rejected on 'close' instead
+      const handleLine = (line) => {
+        if (!line.trim()) return;
+        let record;
+        try {
+          record = JSON.parse(line);
+        } catch (error) {
+          console.error(`[DKB] Failed to parse script output line:`, line);
+          parseError = parseError || error.message;
+          return;
+        }
+        if (record === null || typeof record !== 'object') {
+          console.error(`[DKB] Unexpected script output line:`, line);
+          parseError = parseError || 'unexpected record';
+          return;
+        }
+        if (Array.isArray(record)) {
+          if (!header) {
+            console.error(`[DKB] Transaction received before header:`, line);
+            parseError = parseError || 'transaction before header';
+            return;
+          }
+          const transaction = {};
+          header.transactionFields.forEach((field, i) => {
+            transaction[field] = record[i];
+          });
+          transactions.push(transaction);
+        } else if (record.success === false) {
+          failure = record;
+        } else if (record.type === 'header') {
+          header = record;
+        } else if (record.type === 'end') {
+          finished = true;
+        }
+      };
+
+      const parseLines = (final = false) => {
+        const lines = pending.split('\n');
+        pending = final ? '' : lines.pop();
+        lines.forEach(handleLine);
+      };
+
       pythonProcess.stdout.on('data', (data) => {
-        stdout += data.toString();
+        pending += data.toString();
+        parseLines();
       });
 
       pythonProcess.stderr.on('data', (data) => {
@@ -52,33 +105,41 @@ export class DKBService {
       });
 
       pythonProcess.on('close', (code) => {
+        parseLines(true);
+
         if (code !== 0) {
           console.error(`[DKB] Python script failed with code ${code}`);
-          console.error(`[DKB] stdout:`, stdout);
           console.error(`[DKB] stderr:`, stderr);
 
-          // Try to parse stdout as JSON error
-          try {
-            const errorResult = JSON.parse(stdout);
-            if (errorResult.error) {
-              reject(new Error(`Login failed: ${errorResult.error}`));
-              return;
-            }
-          } catch (e) {
-            // Not JSON, use stderr
+          if (failure && failure.error) {
+            reject(new Error(`Login failed: ${failure.error}`));
+            return;
           }
 
-          reject(new Error(`dkb-robo script failed: ${stderr || stdout || 'Unknown error'}`));
+          reject(new Error(`dkb-robo script failed: ${stderr || 'Unknown error'}`));
           return;
         }
 
-        try {
-          const result = JSON.parse(stdout);
-          resolve(result);
-        } catch (error) {
-          console.error(`[DKB] Failed to parse script output:`, stdout);
-          reject(new Error(`Failed to parse script output: ${error.message}`));
+        if (failure) {
+          resolve(failure);
+          return;
         }
+
+        if (parseError) {
+          reject(new Error(`Failed to parse script output: ${parseError}`));
+          return;
+        }
+
+        if (!header || !finished) {
+          reject(new Error('Failed to parse script output: incomplete transaction stream'));
+          return;
+        }
+
+        resolve({
+          success: true,
+          accounts: header.accounts,
+          transactions
+        });
       });
 
       pythonProcess.on('error', (error) => {
@@ -5,14 +5,229 @@ DKB Transaction Fetcher using dkb-robo library with Friendly Captcha support
 import sys
 import json
 import argparse
-import subprocess
+import atexit
+import contextlib
+import hashlib
+import os
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dkb_robo import DKBRobo
 from dkb_robo.authentication import Authentication, APPAuthentication
+from dkb_robo.portfolio import Overview
 from dkb_robo.utilities import DKBRoboError
 
+# Verbose dkb-robo and patch logging, off by default as it slows down every
+# request and may leak account details into the logs
+DKB_DEBUG = os.getenv('DKB_DEBUG', '0') == '1'
+
+# Progress messages go through one handler on a block-buffered stderr and
+# are flushed at checkpoints, instead of one write syscall per line
+class _BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler that leaves flushing to flush_log()"""
+
+    def flush(self):
+        # StreamHandler.emit() flushes after every record, which would
+        # defeat the buffer; checkpoints call flush_log() instead
+        pass
+
+
+_log_stream = open(sys.stderr.fileno(), 'w', buffering=8192, closefd=False)
+_log_handler = _BufferedStreamHandler(_log_stream)
+_log_handler.setFormatter(logging.Formatter('[%(name)s.py] %(message)s'))
+logger = logging.getLogger('dkb_fetch')
+# The captcha solver logs its progress through the same handler
+for _name in ('dkb_fetch', 'get_captcha_token'):
+    logging.getLogger(_name).setLevel(logging.DEBUG if DKB_DEBUG else logging.INFO)
+    logging.getLogger(_name).addHandler(_log_handler)
+    logging.getLogger(_name).propagate = False
+
+if DKB_DEBUG:
+    # dkb-robo's own logger_setup() only calls basicConfig(), which is a
+    # no-op once the root logger has a handler
+    logging.getLogger('dkb_robo').setLevel(logging.DEBUG)
+
+
+def flush_log():
+    """Write buffered progress messages to stderr"""
+    _log_stream.flush()
+
+
+atexit.register(flush_log)
+
+try:
+    import orjson
+except ImportError:
+    # stdlib json fallback when the C encoder is not installed
+    orjson = None
+
+# Friendly Captcha redeem tokens stay valid for a while; keep the last one
+# so back-to-back runs can skip the browser entirely
+CAPTCHA_CACHE_FILE = '/tmp/dkb_captcha.json'
+CAPTCHA_TOKEN_TTL = 300
+_captcha_cache = {'token': None, 'expires': 0}
+
+# Cookies of the last logged-in session; a still-valid session skips
+# captcha and MFA on the next run
+SESSION_FILE = os.getenv('DKB_SESSION_FILE', '/var/lib/cockpit/dkb_session.json')
+SESSION_MAX_AGE = 3600
+
+
+def _write_private_json(path, data):
+    """Write data as JSON to path, readable by the owner only (mode 0600)"""
+    # O_NOFOLLOW: never truncate the target of a symlink planted in /tmp
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(data, f)
+
+
+def load_cached_captcha_token():
+    """
+    Get the cached captcha token if it is still valid
+
+    Returns:
+        str: Captcha token or None if there is no usable cached token
+    """
+    if not _captcha_cache['token']:
+        try:
+            fd = os.open(CAPTCHA_CACHE_FILE, os.O_RDONLY | os.O_NOFOLLOW)
+            with os.fdopen(fd) as f:
+                # only trust a cache file this user wrote itself
+                if os.fstat(fd).st_uid != os.getuid():
+                    return None
+                _captcha_cache.update(json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    # leave some margin so the token does not expire mid-login
+    if _captcha_cache['token'] and time.time() < _captcha_cache['expires'] - 30:
+        return _captcha_cache['token']
+    return None
+
+
+def store_captcha_token(token):
+    """
+    Cache a freshly solved captcha token in memory and on disk (mode 0600)
+
+    Args:
+        token: The Friendly Captcha redeem token
+    """
+    _captcha_cache['token'] = token
+    _captcha_cache['expires'] = time.time() + CAPTCHA_TOKEN_TTL
+    try:
+        _write_private_json(CAPTCHA_CACHE_FILE, _captcha_cache)
+    except OSError as e:
+        logger.warning("Could not write captcha cache: %s", e)
+
+
+def invalidate_captcha_token():
+    """Drop the cached captcha token, e.g. after it was rejected"""
+    _captcha_cache['token'] = None
+    _captcha_cache['expires'] = 0
+    try:
+        os.remove(CAPTCHA_CACHE_FILE)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove captcha cache: %s", e)
+
+
+def _session_user_key(username):
+    """Identify the session owner without storing the username in clear text"""
+    return hashlib.sha256(username.encode()).hexdigest()
+
+
+def save_session(username, client):
+    """
+    Persist the cookies and headers of a logged-in dkb-robo session
+
+    Args:
+        username: DKB username the session belongs to
+        client: requests.Session after a successful login
+    """
+    data = {
+        'user': _session_user_key(username),
+        'ts': time.time(),
+        'headers': dict(client.headers),
+        'cookies': [
+            {'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path}
+            for c in client.cookies
+        ]
+    }
+    try:
+        os.makedirs(os.path.dirname(SESSION_FILE), mode=0o700, exist_ok=True)
+        _write_private_json(SESSION_FILE, data)
+    except OSError as e:
+        logger.warning("Could not save DKB session: %s", e)
+
+
+def read_saved_session(username):
+    """
+    Read the saved session data of a previous login
+
+    Args:
+        username: DKB username the session must belong to
+
+    Returns:
+        dict or None if there is no recent session for this user
+    """
+    try:
+        with open(SESSION_FILE) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if data.get('user') != _session_user_key(username):
+        return None
+    if time.time() - data.get('ts', 0) > SESSION_MAX_AGE:
+        return None
+    return data
+
+
+def load_session(username, proxies=None):
+    """
+    Rebuild a requests session from the saved cookies of a previous login
+
+    Args:
+        username: DKB username the session must belong to
+        proxies: Optional proxies as configured on dkb-robo
+
+    Returns:
+        requests.Session or None if there is no recent session for this user
+    """
+    data = read_saved_session(username)
+    if data is None:
+        return None
+
+    client = requests.session()
+    client.headers.clear()
+    client.headers.update(data.get('headers', {}))
+    if proxies:
+        client.proxies = proxies
+        client.verify = False  # NOSONAR
+    for cookie in data.get('cookies', []):
+        client.cookies.set(
+            cookie['name'], cookie['value'], domain=cookie['domain'], path=cookie['path']
+        )
+    mount_pooled_adapter(client)
+    return client
+
+
+def invalidate_session():
+    """Drop the saved session, e.g. after the server rejected it"""
+    try:
+        os.remove(SESSION_FILE)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning("Could not remove saved DKB session: %s", e)
+
+
 def get_captcha_token(max_retries=3):
     """
     Get Friendly Captcha token using SeleniumBase with retry logic
@@ -23,59 +238,86 @@ def get_captcha_token(max_retries=3):
     Returns:
         str: Captcha token or None on error
     """
-    print("[dkb_fetch.py] Getting captcha token...", file=sys.stderr)
+    # Imported here so runs that reuse a cached token or saved session
+    # do not pay for loading SeleniumBase
+    from get_captcha_token import CaptchaSession
 
-    for attempt in range(1, max_retries + 1):
-        print(f"[dkb_fetch.py] Captcha attempt {attempt}/{max_retries}...", file=sys.stderr)
+    logger.info("Getting captcha token...")
 
-        try:
-            # Run the captcha solver script
-            # Use longer timeout (450s) as Friendly Captcha can take a long time in headless mode
-            result = subprocess.run(
-                ['python3', '/app/server/get_captcha_token.py'],
-                capture_output=True,
-                text=True,
-                timeout=450
-            )
+    try:
+        # Launch the browser once and reuse it for every attempt;
+        # keep stdout clean for the JSON result while it runs
+        with contextlib.redirect_stdout(sys.stderr), \
+                CaptchaSession(timeout=400, headless=True) as session:
+            for attempt in range(1, max_retries + 1):
+                logger.info("Captcha attempt %s/%s...", attempt, max_retries)
+                # progress lines must show up while the solve is running
+                flush_log()
 
-            if result.returncode == 0:
-                data = json.loads(result.stdout)
-                if data.get('success'):
-                    token = data.get('token')
-                    print(f"[dkb_fetch.py] Got captcha token (length: {len(token)})", file=sys.stderr)
+                try:
+                    token = session.solve()
+                except Exception as e:
+                    # solve() only raises once the browser itself is gone
+                    logger.error("Attempt %s failed permanently: %s", attempt, e)
+                    break
+
+                if token:
+                    logger.info("Got captcha token (length: %s)", len(token))
+                    store_captcha_token(token)
                     return token
 
-            print(f"[dkb_fetch.py] Attempt {attempt} failed: {result.stderr}", file=sys.stderr)
+                logger.warning("Attempt %s failed: no token returned", attempt)
 
-        except subprocess.TimeoutExpired:
-            print(f"[dkb_fetch.py] Attempt {attempt} timed out after 180s", file=sys.stderr)
-        except Exception as e:
-            print(f"[dkb_fetch.py] Attempt {attempt} error: {e}", file=sys.stderr)
+                if attempt < max_retries:
+                    # captcha not solved in time or flaky page, back off and retry
+                    delay = min(2 ** attempt, 10)
+                    logger.info("Retrying in %s seconds...", delay)
+                    flush_log()
+                    time.sleep(delay)
 
-        if attempt < max_retries:
-            print(f"[dkb_fetch.py] Retrying in 5 seconds...", file=sys.stderr)
-            import time
-            time.sleep(5)
+    except Exception as e:
+        logger.error("Captcha browser error: %s", e)
 
-    print(f"[dkb_fetch.py] Failed to get captcha token after {max_retries} attempts", file=sys.stderr)
+    logger.error("Failed to get captcha token")
     return None
 
 
-def patch_dkb_authentication(captcha_token):
+def obtain_captcha_token():
+    """
+    Get a captcha token, reusing a still-valid one from a previous run
+
+    Returns:
+        tuple: (token or None on error, whether the token came from the cache)
+    """
+    captcha_token = load_cached_captcha_token()
+    if captcha_token is not None:
+        logger.info("Reusing cached captcha token")
+        return captcha_token, True
+    return get_captcha_token(), False
+
+
+def patch_dkb_authentication(captcha_token=None, from_cache=False):
     """
     Monkey-patch dkb-robo Authentication to include captcha token
     and extend MFA timeout for phone approval
 
     Args:
-        captcha_token: The Friendly Captcha redeem token
+        captcha_token: The Friendly Captcha redeem token, or None to get one
+            only once dkb-robo actually performs a full login
+        from_cache: Whether the token was reused from the cache; a rejected
+            cached token is replaced by a freshly solved one once
     """
-    logger = logging.getLogger(__name__)
-
     # Patch 1: Add captcha token to login
     def patched_token_get(self):
         """Patched version that includes captcha_token"""
+        nonlocal captcha_token, from_cache
         logger.debug("Authentication._token_get() [PATCHED WITH CAPTCHA]\n")
 
+        if captcha_token is None:
+            captcha_token, from_cache = obtain_captcha_token()
+            if not captcha_token:
+                raise DKBRoboError("Failed to get captcha token")
+
         # login via API with captcha token
         data_dic = {
             "captcha_token": captcha_token,
@@ -85,6 +327,18 @@ def patch_dkb_authentication(captcha_token):
             "sca_type": "web-login",
         }
         response = self.client.post(self.base_url + "/token", data=data_dic)
+        # a submitted token is spent whether it was accepted or rejected,
+        # so it must not be reused by later runs
+        invalidate_captcha_token()
+        if response.status_code != 200 and from_cache:
+            # cached token was rejected, solve a fresh one and retry once
+            logger.warning("Cached captcha token rejected (RC: %s), solving a new one...",
+                           response.status_code)
+            fresh_token = get_captcha_token()
+            if fresh_token:
+                data_dic["captcha_token"] = fresh_token
+                response = self.client.post(self.base_url + "/token", data=data_dic)
+                invalidate_captcha_token()
         if response.status_code == 200:
             self.token_dic = response.json()
         else:
@@ -103,16 +357,16 @@ def patch_mfa_timeout():
     and redirect print output to stderr (to not corrupt JSON output)
     Must be called before any DKBRobo instance is created
     """
-    logger = logging.getLogger(__name__)
-
     # Patch _print to use stderr instead of stdout
     def patched_app_print(self, devicename):
         """Patched version that prints to stderr"""
         logger.debug("APPAuthentication._print() [PATCHED TO STDERR]\n")
         if devicename:
-            print(f'[dkb_fetch.py] Check your banking app on "{devicename}" and confirm login...', file=sys.stderr)
+            logger.info('Check your banking app on "%s" and confirm login...', devicename)
         else:
-            print("[dkb_fetch.py] Check your banking app and confirm login...", file=sys.stderr)
+            logger.info("Check your banking app and confirm login...")
+        # the user has to act on this one, do not keep it in the buffer
+        flush_log()
 
     # Patch: Extend MFA timeout from 50s to 120s for phone approval
     def patched_app_finalize(self, challenge_id, challenge_dic, devicename):
@@ -123,16 +377,26 @@ def patch_mfa_timeout():
 
         cnt = 0
         mfa_completed = False
-        # Extended timeout: 24 iterations × 5 seconds = 120 seconds for phone approval
-        max_iterations = 24
-        print(f"[dkb_fetch.py] Waiting for phone approval (up to {max_iterations * 5}s)...", file=sys.stderr)
-
-        while cnt <= max_iterations:
+        # Extended timeout: 120 seconds for phone approval
+        timeout = 120
+        # Poll quickly at first so an approval is picked up within a second,
+        # then back off to at most one request every 3 seconds
+        interval = 0.5
+        start = time.monotonic()
+        deadline = start + timeout
+        next_notice = 20
+        # Give up early on a broken session instead of polling until the deadline
+        fail_streak = 0
+        max_failures = 3
+        logger.info("Waiting for phone approval (up to %ss)...", timeout)
+
+        while True:
             response = self.client.get(
                 self.base_url + f"/mfa/mfa/challenges/{challenge_id}"
             )
             cnt += 1
             if response.status_code == 200:
+                fail_streak = 0
                 polling_dic = response.json()
                 if (
                     "data" in polling_dic
@@ -142,16 +406,31 @@ def patch_mfa_timeout():
                     # check processing status
                     mfa_completed = self._check(polling_dic, cnt)
                     if mfa_completed:
-                        print(f"[dkb_fetch.py] Phone approval received!", file=sys.stderr)
+                        logger.info("Phone approval received!")
+                        flush_log()
                         break
                 else:
                     logger.error("error parsing polling response: %s", polling_dic)
+            elif response.status_code in (401, 403):
+                # authentication is already invalid, polling cannot recover
+                logger.error("Polling request rejected. RC: %s", response.status_code)
+                break
             else:
                 logger.error("Polling request failed. RC: %s", response.status_code)
-
-            if cnt % 4 == 0:
-                print(f"[dkb_fetch.py] Still waiting for approval... ({cnt * 5}s)", file=sys.stderr)
-            time.sleep(5)
+                fail_streak += 1
+                if fail_streak >= max_failures:
+                    logger.error("Giving up after %s failed polling requests", fail_streak)
+                    break
+
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now - start >= next_notice:
+                logger.info("Still waiting for approval... (%ss)", int(now - start))
+                flush_log()
+                next_notice += 20
+            time.sleep(min(interval, deadline - now))
+            interval = min(interval * 1.5, 3.0)
 
         logger.debug("APPAuthentication.finalize(): %s\n", mfa_completed)
         return mfa_completed
@@ -159,53 +438,174 @@ def patch_mfa_timeout():
     # Apply the patches at module level
     APPAuthentication._print = patched_app_print
     APPAuthentication.finalize = patched_app_finalize
-    print("[dkb_fetch.py] MFA patches applied (120s timeout, stderr output)", file=sys.stderr)
+    logger.info("MFA patches applied (120s timeout, stderr output)")
+
+
+def mount_pooled_adapter(client):
+    """
+    Mount a keep-alive connection pool on a requests session so the token,
+    MFA polling and transaction requests reuse the same TLS connections
+
+    Args:
+        client: requests.Session used by dkb-robo
+    """
+    # Only idempotent GETs are retried, the token POST consumes the captcha.
+    # Once retries are used up the last response is returned as before
+    # instead of raising RetryError, callers check the status code.
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    # pool_maxsize matches the transaction fetch worker count
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=retry)
+    client.mount("https://", adapter)
+    client.headers["Connection"] = "keep-alive"
+
+
+# Sessions created ahead of the login by prewarm_session()
+_prewarmed_sessions = []
+
+
+def prewarm_session():
+    """
+    Set up the dkb-robo session (DNS, TLS, login page cookies and CSRF
+    token) ahead of the login so it overlaps with the captcha solve
+    """
+    try:
+        _prewarmed_sessions.append(Authentication()._session_new())
+    except Exception as e:
+        logger.warning("Could not prewarm DKB session: %s", e)
+
+
+def patch_connection_pooling():
+    """
+    Monkey-patch Authentication._session_new to mount the pooled adapter
+    on every session dkb-robo creates, before the first login request,
+    and to hand out a session prepared by prewarm_session() if there is one
+    """
+    original_session_new = Authentication._session_new
+
+    def patched_session_new(self):
+        """Patched version that mounts a keep-alive connection pool"""
+        if _prewarmed_sessions and not self.proxies:
+            return _prewarmed_sessions.pop()
+        client = original_session_new(self)
+        mount_pooled_adapter(client)
+        return client
+
+    Authentication._session_new = patched_session_new
+
+
+def patch_session_reuse():
+    """
+    Monkey-patch Authentication.login to replay the cookies of the last
+    session before doing a full captcha + MFA login, and to save the
+    cookies after a successful full login
+    """
+    original_login = Authentication.login
+
+    def patched_login(self):
+        """Patched version that tries a saved session first"""
+        client = load_session(self.dkb_user, self.proxies)
+        if client is not None:
+            try:
+                # cheap authenticated request to check the session is still valid
+                response = client.get(self.base_url + "/config/users/me/product-display-settings")
+                status_code = response.status_code
+            except requests.RequestException as e:
+                status_code = str(e)
+
+            if status_code == 200:
+                logger.info("Reusing saved DKB session, skipping captcha and MFA")
+                self.client = client
+                overview = Overview(client=self.client, unfiltered=self.unfiltered)
+                self.account_dic = overview.get()
+                return self.account_dic, None
+
+            logger.warning("Saved DKB session rejected (%s), logging in again", status_code)
+            invalidate_session()
+
+        result = original_login(self)
+        save_session(self.dkb_user, self.client)
+        return result
+
+    Authentication.login = patched_login
 
 
 # Apply MFA timeout patch immediately when module is loaded
 patch_mfa_timeout()
+patch_connection_pooling()
+patch_session_reuse()
+
 
+# Transaction row layout, listed in the header record. Rows are emitted as
+# plain tuples in this order and written as JSON arrays, which avoids
+# building a dict per transaction
+TX_FIELDS = ('accountId', 'accountIban', 'bookingDate', 'valueDate',
+             'payee', 'purpose', 'amount', 'currency', 'source')
+TX_SOURCE = 'dkb-robo'
 
-def fetch_transactions(username, password, account_id=None, days=90):
+
+def emit(record, out):
+    """Write a single NDJSON record to out"""
+    if orjson is not None:
+        out.write(orjson.dumps(record).decode() + '\n')
+    else:
+        out.write(json.dumps(record) + '\n')
+
+
+def fetch_transactions(username, password, account_id=None, days=90, out=None):
     """
-    Fetch transactions from DKB account
+    Fetch transactions from DKB account and stream them as NDJSON
+
+    Writes a header record with the accounts and the transaction field
+    names, one array per transaction (flushed after each account) and an
+    end record. Errors are written as
+    a single {"success": false, "error": ...} record.
 
     Args:
         username: DKB username
         password: DKB password
         account_id: Optional specific account ID
         days: Number of days to fetch (default 90)
-
-    Returns:
-        JSON string with accounts and transactions
+        out: Text stream to write to (default sys.stdout)
     """
+    if out is None:
+        out = sys.stdout
+
     # Log that script was called
-    print(f"[dkb_fetch.py] Script called with:", file=sys.stderr)
-    print(f"[dkb_fetch.py] - username: {username}", file=sys.stderr)
-    print(f"[dkb_fetch.py] - password length: {len(password) if password else 0}", file=sys.stderr)
-    print(f"[dkb_fetch.py] - account_id: {account_id}", file=sys.stderr)
-    print(f"[dkb_fetch.py] - days: {days}", file=sys.stderr)
+    logger.info("Script called with:")
+    logger.info("- username: %s", username)
+    logger.info("- password length: %s", len(password) if password else 0)
+    logger.info("- account_id: %s", account_id)
+    logger.info("- days: %s", days)
 
     try:
-        # Get captcha token first
-        captcha_token = get_captcha_token()
-        if not captcha_token:
-            return json.dumps({
-                'success': False,
-                'error': 'Failed to get captcha token'
-            })
-
-        # Patch dkb-robo to use the captcha token
-        patch_dkb_authentication(captcha_token)
+        if read_saved_session(username) is None:
+            # Full login ahead: solve the captcha while the DKB session is set up
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                pool.submit(prewarm_session)
+                captcha_token, from_cache = obtain_captcha_token()
+            if not captcha_token:
+                emit({
+                    'success': False,
+                    'error': 'Failed to get captcha token'
+                }, out)
+                return
+            patch_dkb_authentication(captcha_token, from_cache)
+        else:
+            # A saved session may skip the login, only solve the captcha
+            # if dkb-robo ends up doing a full login
+            patch_dkb_authentication()
         # Login to DKB
         # mfa_device=1 auto-selects the first (preferred) device to avoid interactive prompt
-        # debug=True for detailed logging
-        with DKBRobo(dkb_user=username, dkb_password=password, mfa_device=1, debug=True) as dkb:
-            result = {
-                'success': True,
-                'accounts': [],
-                'transactions': []
-            }
+        # debug only when DKB_DEBUG=1 is set
+        with DKBRobo(dkb_user=username, dkb_password=password, mfa_device=1, debug=DKB_DEBUG) as dkb:
+            logger.info("Login complete, %s accounts found", len(dkb.account_dic))
+            flush_log()
 
             # Get account list
             accounts = []
@@ -222,80 +622,110 @@ def fetch_transactions(username, password, account_id=None, days=90):
                 }
                 accounts.append(account_info)
 
-            result['accounts'] = accounts
-
             # If specific account requested, fetch only that one
-            if account_id:
-                account_indices = [idx for idx, acc in dkb.account_dic.items()
-                                 if acc.get('id') == account_id]
-                if not account_indices:
-                    return json.dumps({
-                        'success': False,
-                        'error': f'Account {account_id} not found'
-                    })
-                target_indices = account_indices
-            else:
-                # Fetch all accounts
-                target_indices = list(dkb.account_dic.keys())
+            if account_id and not any(acc.get('id') == account_id
+                                      for acc in dkb.account_dic.values()):
+                emit({
+                    'success': False,
+                    'error': f'Account {account_id} not found'
+                }, out)
+                return
+
+            # Accounts to fetch; accounts without transaction URL are skipped
+            # up front so only real requests get scheduled
+            work = [(idx, acc) for idx, acc in dkb.account_dic.items()
+                    if (not account_id or acc.get('id') == account_id)
+                    and acc.get('transactions')]
+
+            emit({
+                'success': True,
+                'type': 'header',
+                'accounts': accounts,
+                'transactionFields': TX_FIELDS
+            }, out)
+            out.flush()
 
-            # Fetch transactions for each account
-            date_from = datetime.now() - timedelta(days=days)
-            date_to = datetime.now()
+            # Fetch transactions for each account; take "now" once so both
+            # ends of the range come from the same clock reading
+            now = datetime.now()
 
             # Format dates in German format DD.MM.YYYY
-            date_from_str = date_from.strftime('%d.%m.%Y')
-            date_to_str = date_to.strftime('%d.%m.%Y')
-
-            for idx in target_indices:
-                account = dkb.account_dic[idx]
-                account_type = account.get('type')
-                transaction_url = account.get('transactions')
-
-                if not transaction_url:
-                    # Skip accounts without transaction URL
-                    continue
-
-                try:
-                    # Fetch transactions using the transaction URL and type
-                    trans_list = dkb.get_transactions(
-                        transaction_url,
-                        account_type,
-                        date_from_str,
-                        date_to_str
-                    )
-
-                    # Convert transactions to our format
-                    for trans in trans_list:
-                        # Map dkb-robo transaction fields to our format
-                        # Checking account: peer, reasonforpayment
-                        # Credit card: text field contains description
-                        payee = trans.get('peer', trans.get('text', ''))
-                        purpose = trans.get('reasonforpayment', trans.get('postingtext', trans.get('text', '')))
-
-                        transaction = {
-                            'accountId': account.get('id'),
-                            'accountIban': account.get('iban'),
-                            'bookingDate': trans.get('bdate'),
-                            'valueDate': trans.get('vdate', trans.get('bdate')),
-                            'payee': payee,
-                            'purpose': purpose,
-                            'amount': float(trans.get('amount', 0)),
-                            'currency': trans.get('currencycode', account.get('currencycode', 'EUR')),
-                            'source': 'dkb-robo'
-                        }
-                        result['transactions'].append(transaction)
-
-                except Exception as e:
-                    print(f"Error fetching transactions for account {idx}: {e}", file=sys.stderr)
-                    continue
-
-            return json.dumps(result, indent=2)
+            date_from_str = (now - timedelta(days=days)).strftime('%d.%m.%Y')
+            date_to_str = now.strftime('%d.%m.%Y')
+
+            if work:
+                # Fetch accounts concurrently, the requests are network-bound.
+                # dkb-robo builds a fresh Transactions helper per call and only
+                # shares the underlying requests session between the workers.
+                with ThreadPoolExecutor(max_workers=min(8, len(work))) as pool:
+                    futures = {
+                        pool.submit(
+                            dkb.get_transactions,
+                            acc.get('transactions'),
+                            acc.get('type'),
+                            date_from_str,
+                            date_to_str
+                        ): (idx, acc)
+                        for idx, acc in work
+                    }
+
+                    for future in as_completed(futures):
+                        idx, account = futures[future]
+
+                        try:
+                            trans_list = future.result()
+
+                            # Per-account fields are the same for every row
+                            acc_id = account.get('id')
+                            acc_iban = account.get('iban')
+                            acc_currency = account.get('currencycode', 'EUR')
+
+                            # Convert transactions to our format
+                            for trans in trans_list:
+                                # Map dkb-robo transaction fields to our format
+                                # Checking account: peer, reasonforpayment
+                                # Credit card: text field contains description
+                                # (fallbacks are only looked up when the key is missing)
+                                payee = trans['peer'] if 'peer' in trans else trans.get('text', '')
+                                if 'reasonforpayment' in trans:
+                                    purpose = trans['reasonforpayment']
+                                elif 'postingtext' in trans:
+                                    purpose = trans['postingtext']
+                                else:
+                                    purpose = trans.get('text', '')
+                                bdate = trans.get('bdate')
+
+                                # plain tuple in TX_FIELDS order
+                                emit((
+                                    acc_id,
+                                    acc_iban,
+                                    bdate,
+                                    trans['vdate'] if 'vdate' in trans else bdate,
+                                    payee,
+                                    purpose,
+                                    float(trans.get('amount', 0)),
+                                    trans['currencycode'] if 'currencycode' in trans else acc_currency,
+                                    TX_SOURCE
+                                ), out)
+
+                        except Exception as e:
+                            logger.error("Error fetching transactions for account %s: %s", idx, e)
+                            continue
+                        finally:
+                            # hand each account's transactions to the caller right away
+                            out.flush()
+
+            emit({'type': 'end'}, out)
+            out.flush()
+            logger.info("Fetch complete")
+            flush_log()
 
     except Exception as e:
-        return json.dumps({
+        emit({
             'success': False,
             'error': str(e)
-        })
+        }, out)
+        out.flush()
 
 def main():
     parser = argparse.ArgumentParser(description='Fetch DKB transactions')
@@ -306,14 +736,12 @@ def main():
 
     args = parser.parse_args()
 
-    result = fetch_transactions(
+    fetch_transactions(
         args.username,
         args.password,
         args.account_id,
         args.days
     )
 
-    print(result)
-
 if __name__ == '__main__':
     main()
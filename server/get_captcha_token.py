@@ -6,128 +6,229 @@ Based on: https://gist.github.com/stoppegp/b14017a0414f99b2ec379fbd2c4f93c5
 import asyncio
 import json
 import logging
-import time
 import sys
+import threading
+import time
 import mycdp
 from seleniumbase import SB
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def get_dkb_redeem_token(timeout=400, headless=True):
+# Serializes solve() calls: one browser tab cannot work on two captchas at once
+_solve_lock = threading.Lock()
+
+
+class CaptchaSession:
     """
-    Get DKB Friendly Captcha redeem token
+    Warm SeleniumBase/Chromium session for solving DKB Friendly Captchas
+
+    The browser is launched once on enter and reused by every solve() call,
+    so retries only reload the login page instead of relaunching Chromium.
 
     Args:
-        timeout: Maximum seconds to wait for captcha solving
+        timeout: Maximum seconds to wait for captcha solving per solve()
         headless: Run browser in headless mode
-
-    Returns:
-        str: Redeem token or False on error
     """
-    activate_events = []
-    redeem_events = []
 
-    def listen_to_captcha_redeem(page, redeem_events_loc, activate_events_loc):
+    def __init__(self, timeout=400, headless=True):
+        self.timeout = timeout
+        self.headless = headless
+        self.activate_events = []
+        self.redeem_events = []
+        # set by the CDP handler so waiters wake up as soon as a response arrives
+        self.activate_evt = asyncio.Event()
+        self.redeem_evt = asyncio.Event()
+        self.sb = None
+        self.tab = None
+        self._load_started = None
+        self._sb_context = None
+
+    def __enter__(self):
+        self._sb_context = SB(
+            uc=True,
+            locale="de",
+            disable_features="IsolateOrigins,site-per-process",
+            # Only the captcha widget matters, skip images and web fonts
+            # so the page gets to the frc-i-widget iframe sooner
+            chromium_arg=(
+                "--disable-site-isolation-trials,"
+                "--blink-settings=imagesEnabled=false,"
+                "--disable-remote-fonts"
+            ),
+            headless=self.headless,
+        )
+        self.sb = self._sb_context.__enter__()
+        try:
+            self.sb.activate_cdp_mode("about:blank")
+            self.tab = self.sb.cdp.page
+            self._listen_to_captcha_redeem()
+        except BaseException:
+            self._sb_context.__exit__(*sys.exc_info())
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return self._sb_context.__exit__(exc_type, exc_value, traceback)
+
+    def _listen_to_captcha_redeem(self):
         async def handler(evt):
             if evt.response.url == "https://eu.frcapi.com/api/v2/captcha/redeem":
-                redeem_events_loc.append(evt)
+                self.redeem_events.append(evt)
+                self.redeem_evt.set()
                 logger.info("redeem token request logged!")
             elif evt.response.url == "https://eu.frcapi.com/api/v2/captcha/quote":
-                activate_events_loc.append(evt)
-                logger.info("captcha activated")
-
-        page.add_handler(mycdp.network.ResponseReceived, handler)
-
-    async def get_redeem_response(page, redeem_events_loc):
-        retries = 0
-        while True:
-            retries += 1
-            if len(redeem_events_loc) == 0 and retries <= timeout:
-                logger.debug("Still waiting for captcha solving...")
-                await asyncio.sleep(1)
-            else:
-                # redeem token response found or timeout
-                break
-        if len(redeem_events_loc) > 0:
+                self.activate_events.append(evt)
+                self.activate_evt.set()
+                logger.info(
+                    "captcha activated (%.1fs after page load)",
+                    time.monotonic() - self._load_started,
+                )
+
+        self.tab.add_handler(mycdp.network.ResponseReceived, handler)
+
+    @staticmethod
+    async def _wait_for(event, timeout):
+        """Wait up to timeout seconds for event, return whether it was set"""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _get_redeem_response(self):
+        logger.debug("Waiting for captcha solving...")
+        if await self._wait_for(self.redeem_evt, self.timeout):
             # redeem token response found
             logger.debug("redeem token response found")
             try:
-                res = await page.send(
-                    mycdp.network.get_response_body(redeem_events[-1].request_id)
+                res = await self.tab.send(
+                    mycdp.network.get_response_body(self.redeem_events[-1].request_id)
                 )
                 return json.loads(res[0])["data"]["redeem_token"]
             except Exception as e:
-                logger.error(f"Could not extract redeem token from response: {e}")
+                logger.error("Could not extract redeem token from response: %s", e)
                 return False
         else:
             logger.error("Timeout: redeem token request not found")
             return False
 
-    try:
-        with SB(
-            uc=True,
-            locale="de",
-            disable_features="IsolateOrigins,site-per-process",
-            chromium_arg="--disable-site-isolation-trials",
-            headless=headless,
-        ) as sb:
-            sb.activate_cdp_mode("about:blank")
-            tab = sb.cdp.page
-            listen_to_captcha_redeem(tab, redeem_events, activate_events)
+    def solve(self):
+        """
+        (Re)load the login page and solve the captcha in the warm browser
 
-            logger.info("Loading login page...")
-            sb.cdp.open("https://banking.dkb.de/login")
+        Returns:
+            str: Redeem token or False if the captcha was not solved
 
-            for _ in range(50):
+        Raises:
+            Exception: if the browser is gone, so another attempt cannot help
+        """
+        with _solve_lock:
+            # drop events left over from a previous attempt
+            self.activate_events.clear()
+            self.redeem_events.clear()
+            self.activate_evt.clear()
+            self.redeem_evt.clear()
 
-                if len(activate_events) > 0:
-                    # captcha was activated
-                    break
+            try:
+                return self._solve()
+            except Exception as e:
+                # CDP mode reports page-load races and missing elements with a
+                # plain Exception, so only a dead browser ends the retries
+                if not self._browser_alive():
+                    raise
+                logger.error("Error getting captcha token: %s", e)
+                return False
+
+    def _browser_alive(self):
+        """Check whether the browser still answers CDP commands"""
+        try:
+            self.sb.cdp.get_current_url()
+            return True
+        except Exception:
+            return False
 
-                time.sleep(1)
+    def _solve(self):
+        sb = self.sb
+        loop = sb.cdp.get_event_loop()
 
-                logger.debug("trying to click captcha button")
+        logger.info("Loading login page...")
+        self._load_started = time.monotonic()
+        sb.cdp.open("https://banking.dkb.de/login")
 
-                # clicking on cookie banner if visible
+        banner_dismissed = False
+
+        for _ in range(50):
+
+            # returns as soon as the captcha is activated, else retry the click after 1s
+            if loop.run_until_complete(self._wait_for(self.activate_evt, 1)):
+                break
+
+            logger.debug("trying to click captcha button")
+
+            # In CDP mode SeleniumBase reports a missing element (or frame) with a
+            # plain Exception, so these lookups catch Exception and go round again
+            try:
+                sb.switch_to_default_content()
+            except Exception:
+                pass
+
+            # clicking on cookie banner if visible, it only needs to go away once
+            if not banner_dismissed:
                 try:
-                    sb.switch_to_default_content()
                     sb.find_element(
                         "#usercentrics-cmp-ui::shadow button.uc-accept-button"
                     ).click()
+                    banner_dismissed = True
                     logger.debug("Dismissed cookie banner")
-                except:
+                except Exception:
+                    # banner not shown (yet)
                     pass
 
-                # activate captcha if already visible
-                try:
-                    sb.switch_to_frame("iframe.frc-i-widget", timeout=1)
-                except Exception as e:
-                    # captcha not visible, reloading page
-                    logger.debug("Did not find captcha checkbox")
-                    sb.cdp.refresh()
-                    time.sleep(1)
-                    continue
+            # activate captcha if already visible
+            try:
+                sb.switch_to_frame("iframe.frc-i-widget", timeout=1)
+            except Exception:
+                # captcha not visible, reloading page
+                logger.debug("Did not find captcha checkbox")
+                sb.cdp.refresh()
+                loop.run_until_complete(self._wait_for(self.activate_evt, 1))
+                continue
 
-                try:
-                    # click on button
-                    sb.find_element("button.checkbox", timeout=1).click()
-                    logger.info("Clicked on Captcha")
-                    break
-                except:
-                    # try again if not successful
-                    pass
+            try:
+                # click on button
+                sb.find_element("button.checkbox", timeout=1).click()
+                logger.info("Clicked on Captcha")
+                break
+            except Exception:
+                # try again if not successful
+                pass
+
+        return loop.run_until_complete(self._get_redeem_response())
 
-            loop = sb.cdp.get_event_loop()
-            token = loop.run_until_complete(get_redeem_response(tab, redeem_events))
-            return token
+
+def get_dkb_redeem_token(timeout=400, headless=True):
+    """
+    Get DKB Friendly Captcha redeem token in a one-off browser session
+
+    Args:
+        timeout: Maximum seconds to wait for captcha solving
+        headless: Run browser in headless mode
+
+    Returns:
+        str: Redeem token or False on error
+    """
+    try:
+        with CaptchaSession(timeout=timeout, headless=headless) as session:
+            return session.solve()
     except Exception as e:
-        logger.error(f"Error getting captcha token: {e}")
+        logger.error("Error getting captcha token: %s", e)
         return False
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
     # Get token - use longer timeout in headless mode as captcha solving takes longer
     token = get_dkb_redeem_token(timeout=400, headless=True)
 